@@ -7,8 +7,9 @@ với chính sách hết hạn theo thời gian (Time-To-Live) và giới hạn
 """
 
 import logging
+import threading
 from functools import wraps
-from typing import Any, Callable
+from typing import Any, Callable, List, Optional, Tuple
 
 from cachetools import TTLCache
 
@@ -21,6 +22,33 @@ logger = logging.getLogger(__name__)
 #   1800 giây (30 phút), đảm bảo dữ liệu không quá cũ.
 service_cache = TTLCache(maxsize=128, ttl=1800)
 
+# Các cache riêng có TTL ngắn hơn (xem tham số `ttl` của `sync_cache`), được
+# đăng ký ở đây để `clear_service_cache` xóa cùng lúc.
+_ttl_caches: List[TTLCache] = []
+
+# `TTLCache` không an toàn khi dùng đồng thời từ nhiều luồng. Các hàm đồng bộ
+# được FastAPI chạy trong threadpool, nên mọi thao tác đọc/ghi cache đều phải
+# đi qua khóa này (khóa chỉ giữ trong thời gian tra cứu, không bao quanh I/O).
+_cache_lock = threading.RLock()
+
+
+def _cache_lookup(key: int, cache: TTLCache = service_cache) -> Tuple[bool, Any]:
+    """Tra cứu `key` trong cache, trả về (có trong cache hay không, giá trị)."""
+    try:
+        return True, cache[key]
+    except KeyError:
+        return False, None
+
+
+def _is_empty(result: Any) -> bool:
+    """Kiểm tra kết quả có rỗng (None, list/DataFrame rỗng...) hay không."""
+    if result is None:
+        return True
+    try:
+        return len(result) == 0
+    except TypeError:
+        return False
+
 
 def async_cache(func: Callable) -> Callable:
     """
@@ -50,17 +78,70 @@ def async_cache(func: Callable) -> Callable:
         key = hash(key_parts)
 
         # 1. Cache hit: Nếu key tồn tại, trả về kết quả ngay lập tức.
-        if key in service_cache:
-            logger.debug(f"Cache hit for function '{func.__name__}' with key '{key}'")
-            return service_cache[key]
+        # Log debug dùng tham số kiểu `%s` (định dạng lười): chuỗi chỉ được
+        # dựng khi cấp DEBUG thực sự bật, không tốn chi phí trên mỗi request.
+        with _cache_lock:
+            hit, cached = _cache_lookup(key)
+        if hit:
+            logger.debug("Cache hit for function '%s' with key '%s'", func.__name__, key)
+            return cached
 
         # 2. Cache miss: Nếu không có trong cache, gọi hàm gốc.
-        logger.debug(f"Cache miss for function '{func.__name__}' with key '{key}'")
+        logger.debug("Cache miss for function '%s' with key '%s'", func.__name__, key)
         result = await func(self, *args, **kwargs)
 
         # 3. Lưu vào cache: Lưu kết quả mới vào cache với key đã tạo.
-        service_cache[key] = result
-        logger.debug(f"Result for '{func.__name__}' stored in cache.")
+        with _cache_lock:
+            service_cache[key] = result
+        logger.debug("Result for '%s' stored in cache.", func.__name__)
+
+        return result
+
+    return wrapper
+
+
+def sync_cache(
+    func: Optional[Callable] = None, *, ttl: Optional[int] = None
+) -> Callable:
+    """
+    Decorator để cache kết quả của một hàm đồng bộ không phụ thuộc vào
+    bộ lọc của người dùng (ví dụ: các static method của service).
+
+    Mặc định dùng chung `service_cache` với `async_cache`. Truyền `ttl` (giây)
+    để dùng một cache riêng hết hạn sớm hơn, cho dữ liệu cần mới hơn (ví dụ:
+    log lỗi). Cả hai đều được xóa khi gọi `clear_service_cache`. Kết quả rỗng
+    hoặc None không được cache.
+
+    Dùng được cả dạng `@sync_cache` và `@sync_cache(ttl=60)`.
+    """
+    if func is None:
+        return lambda f: sync_cache(f, ttl=ttl)
+
+    cache = service_cache
+    if ttl is not None:
+        cache = TTLCache(maxsize=32, ttl=ttl)
+        _ttl_caches.append(cache)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs) -> Any:
+        key = hash((func.__qualname__, args, frozenset(kwargs.items())))
+
+        with _cache_lock:
+            hit, cached = _cache_lookup(key, cache)
+        if hit:
+            logger.debug("Cache hit for function '%s' with key '%s'", func.__name__, key)
+            return cached
+
+        logger.debug("Cache miss for function '%s' with key '%s'", func.__name__, key)
+        result = func(*args, **kwargs)
+        # Các hàm service nuốt lỗi truy vấn và trả về rỗng/None (ví dụ khi
+        # DuckDB đang bị ETL khóa). Không lưu các kết quả này, tránh giữ một
+        # lỗi tạm thời trong cache suốt thời gian TTL.
+        if _is_empty(result):
+            return result
+        with _cache_lock:
+            cache[key] = result
+        logger.debug("Result for '%s' stored in cache.", func.__name__)
 
         return result
 
@@ -74,5 +155,8 @@ def clear_service_cache():
     Hữu ích khi cần làm mới dữ liệu sau khi ETL hoàn tất.
     """
     logger.info(f"Đang xóa cache. Kích thước hiện tại: {service_cache.currsize} items.")
-    service_cache.clear()
+    with _cache_lock:
+        service_cache.clear()
+        for cache in _ttl_caches:
+            cache.clear()
     logger.info("✅ Cache đã được xóa thành công.")
@@ -84,6 +84,16 @@ class DatabaseSettings(BaseModel):
             f"?driver={driver_for_query}"
         )
 
+    @property
+    def connectorx_uri(self) -> str:
+        """Chuỗi kết nối SQL Server theo định dạng của ConnectorX."""
+        encoded_uid = parse.quote_plus(self.SQLSERVER_UID)
+        encoded_pwd = parse.quote_plus(self.SQLSERVER_PWD)
+        return (
+            f"mssql://{encoded_uid}:{encoded_pwd}"
+            f"@{self.SQLSERVER_SERVER}/{self.SQLSERVER_DATABASE}"
+        )
+
 
 class TableConfig(BaseModel):
     """
@@ -159,11 +169,25 @@ class Settings(BaseSettings):
     # --- Cấu hình ETL ---
     DATA_DIR: Path = Path("data")
     ETL_CHUNK_SIZE: int = 100_000
+    # Thư viện dùng để đọc dữ liệu từ SQL Server. `connectorx` đọc thẳng vào
+    # Arrow nhanh hơn nhiều nhưng cần cài thêm gói `connectorx`.
+    ETL_EXTRACT_BACKEND: Literal["sqlalchemy", "connectorx"] = "sqlalchemy"
     ETL_DEFAULT_TIMESTAMP: str = "1900-01-01 00:00:00"
     ETL_CLEANUP_ON_FAILURE: bool = True
+    # Thuật toán và mức nén cho các tệp Parquet trong staging area. Mức nén
+    # chỉ được dùng với các codec hỗ trợ (zstd, gzip, brotli) và bị bỏ qua
+    # với các codec khác như snappy.
+    ETL_PARQUET_COMPRESSION: str = "zstd"
+    ETL_PARQUET_COMPRESSION_LEVEL: Optional[int] = 3
     TABLE_CONFIG_PATH: Path = Path("configs/tables.yaml")
     TIME_OFFSETS_PATH: Path = Path("configs/time_offsets.yaml")
 
+    # --- Cấu hình DuckDB cho ETL ---
+    # Số luồng DuckDB được dùng khi nạp Parquet. `None` = số CPU của máy.
+    DUCKDB_THREADS: Optional[int] = None
+    # Giới hạn bộ nhớ cho DuckDB (ví dụ: "8GB"). `None` = mặc định của DuckDB.
+    DUCKDB_MEMORY_LIMIT: Optional[str] = None
+
     # --- Thuộc tính được tính toán và tải động ---
     db: Optional[DatabaseSettings] = None
     TABLE_CONFIG: Dict[str, TableConfig] = Field(default_factory=dict)
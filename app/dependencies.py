@@ -38,7 +38,7 @@ def get_db_connection() -> Iterator[DuckDBPyConnection]:
     conn = None
     try:
         db_path = str(settings.DUCKDB_PATH.resolve())
-        logger.debug(f"Đang mở kết nối tới DuckDB (read-only): {db_path}")
+        logger.debug("Đang mở kết nối tới DuckDB (read-only): %s", db_path)
 
         # Kết nối ở chế độ READ_ONLY để đảm bảo an toàn, API chỉ có quyền đọc.
         conn = duckdb.connect(database=db_path, read_only=True)
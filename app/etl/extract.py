@@ -12,12 +12,120 @@ import pandas as pd
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SQLAlchemyError
-from typing import Iterator
+from typing import Iterator, List
 
+from .schemas import table_schemas
+from .transform import OFFSET_STORE_ID_COL
 from ..core.config import settings, TableConfig
 
 logger = logging.getLogger(__name__)
 
+# Các dấu hiệu (chữ thường) trong thông báo `RuntimeError` của ConnectorX cho
+# thấy lỗi kết nối/I-O tạm thời, đáng để retry. Lỗi cú pháp SQL, sai tên cột,
+# lỗi chuyển đổi kiểu... không khớp và được ném ra nguyên trạng.
+_CX_TRANSIENT_MARKERS = (
+    "io error",
+    "connection",
+    "timed out",
+    "timeout",
+    "broken pipe",
+    "network",
+    "unexpected eof",
+    "os error",
+)
+
+
+def _source_columns(config: TableConfig) -> List[str]:
+    """
+    Xác định các cột nguồn cần SELECT từ SQL Server.
+
+    Lấy những cột sẽ còn tồn tại sau bước transform (theo schema Pandera của
+    bảng đích), cộng với các cột gốc mà transform đọc trước khi validate
+    (cột dùng cho time offset và cột của các cleaning rule), để bước
+    transform không bao giờ thiếu cột đầu vào.
+    """
+    schema = table_schemas.get(config.dest_table)
+    if schema is None:
+        columns = list(config.rename_map.keys())
+    else:
+        final_cols = [
+            col
+            for col in schema.to_schema().columns
+            if col not in config.partition_cols  # Cột partition được tạo lúc transform.
+        ]
+        if config.rename_map:
+            columns = [
+                src for src, dest in config.rename_map.items() if dest in final_cols
+            ]
+        else:
+            columns = final_cols
+
+    # Các cột gốc mà transform cần: timestamp (lọc incremental, time offset),
+    # mã cửa hàng nếu bảng có time offset, và cột của các cleaning rule.
+    required = [config.timestamp_col]
+    if settings.TIME_OFFSETS.get(config.source_table.split(".")[-1]):
+        required.append(OFFSET_STORE_ID_COL)
+    required += [rule.column for rule in config.cleaning_rules]
+
+    for col in required:
+        if col and col not in columns:
+            columns.append(col)
+    return columns
+
+
+def _from_connectorx(
+    query: str, params: dict, config: TableConfig
+) -> Iterator[pd.DataFrame]:
+    """
+    Trích xuất dữ liệu bằng ConnectorX dưới dạng luồng Arrow record batch.
+
+    ConnectorX đọc trực tiếp vào bộ đệm cột của Arrow (không đi qua các tuple
+    Python của DB-API) và trả về từng batch có kích thước `ETL_CHUNK_SIZE`,
+    nên bộ nhớ vẫn được giới hạn như khi dùng `pd.read_sql(chunksize=...)`.
+
+    Raises:
+        ImportError: Nếu thư viện `connectorx` chưa được cài đặt.
+        OSError: Nếu ConnectorX gặp lỗi kết nối/I-O khi thực thi truy vấn
+            hoặc khi đọc các batch (để được retry).
+        RuntimeError: Với các lỗi ConnectorX khác (không retry).
+    """
+    try:
+        import connectorx as cx
+    except ImportError as e:
+        raise ImportError(
+            "ETL_EXTRACT_BACKEND='connectorx' yêu cầu cài đặt thư viện "
+            "`connectorx` (poetry install --extras connectorx)."
+        ) from e
+
+    # ConnectorX không hỗ trợ tham số bind, nên high-water mark được chuẩn hóa
+    # qua `pd.Timestamp` trước khi đưa vào câu lệnh để loại bỏ mọi ký tự lạ.
+    if "last_ts" in params:
+        last_ts = pd.Timestamp(params["last_ts"]).isoformat(
+            sep=" ", timespec="seconds"
+        )
+        query = query.replace(":last_ts", f"'{last_ts}'")
+
+    # Bao cả vòng lặp đọc batch: lỗi mạng giữa chừng cũng được ConnectorX ném
+    # ra dưới dạng `RuntimeError` khi lấy batch tiếp theo.
+    try:
+        reader = cx.read_sql(
+            settings.db.connectorx_uri,
+            query,
+            return_type="arrow_stream",
+            batch_size=settings.ETL_CHUNK_SIZE,
+        )
+        for batch in reader:
+            if batch.num_rows:
+                yield batch.to_pandas()
+    except RuntimeError as e:
+        logger.error(
+            f"Lỗi ConnectorX khi trích xuất từ bảng '{config.source_table}': {e}"
+        )
+        message = str(e).lower()
+        if any(marker in message for marker in _CX_TRANSIENT_MARKERS):
+            raise OSError(str(e)) from e
+        raise
+
 
 def from_sql_server(
     sql_engine: Engine, config: TableConfig, last_timestamp: str
@@ -39,16 +147,12 @@ def from_sql_server(
     Raises:
         SQLAlchemyError: Nếu có lỗi xảy ra trong quá trình thực thi truy vấn SQL.
     """
-    source_columns = list(config.rename_map.keys())
-
-    # Nếu là incremental, đảm bảo cột timestamp có trong danh sách để lọc.
-    if config.timestamp_col and config.timestamp_col not in source_columns:
-        source_columns.append(config.timestamp_col)
+    source_columns = _source_columns(config)
 
     if not source_columns:
         logger.warning(
-            f"Bảng '{config.source_table}': Không có cột nào trong 'rename_map'. "
-            f"Sử dụng 'SELECT *' làm mặc định."
+            f"Bảng '{config.source_table}': Không xác định được cột cần lấy "
+            f"(thiếu 'rename_map' và schema). Sử dụng 'SELECT *' làm mặc định."
         )
         columns_selection = "*"
     else:
@@ -70,7 +174,10 @@ def from_sql_server(
         logger.info(f"Trích xuất full-load từ '{config.source_table}'.")
 
     # Ghi log câu lệnh SQL đầy đủ ở cấp độ DEBUG để tiện cho việc gỡ lỗi.
-    logger.debug(f"Executing SQL: {query} with params: {params}")
+    logger.debug("Executing SQL: %s with params: %s", query, params)
+
+    if settings.ETL_EXTRACT_BACKEND == "connectorx":
+        return _from_connectorx(query, params, config)
 
     try:
         # Sử dụng `pd.read_sql` với `chunksize` để trả về một iterator,
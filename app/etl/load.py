@@ -24,6 +24,30 @@ logger = logging.getLogger(__name__)
 BASE_DATA_PATH = Path(settings.DATA_DIR)
 
 
+# Các codec Parquet cho phép đặt mức nén; các codec khác (snappy, lz4, none)
+# sẽ báo lỗi `ArrowInvalid` nếu nhận `compression_level`.
+_CODECS_WITH_LEVEL = {"zstd", "gzip", "brotli"}
+
+
+def _parquet_write_options() -> dict:
+    """
+    Tùy chọn ghi Parquet dùng chung cho cả dataset phân vùng và tệp đơn.
+
+    zstd giải nén nhanh hơn và nén tốt hơn snappy (mặc định của PyArrow).
+    Mức nén chỉ được truyền khi codec hỗ trợ, để đổi sang snappy/none chỉ
+    cần đổi `ETL_PARQUET_COMPRESSION`.
+    """
+    compression = settings.ETL_PARQUET_COMPRESSION
+    options = {
+        "compression": compression,
+        "data_page_version": "2.0",
+    }
+    level = settings.ETL_PARQUET_COMPRESSION_LEVEL
+    if level is not None and compression.lower() in _CODECS_WITH_LEVEL:
+        options["compression_level"] = level
+    return options
+
+
 class ParquetLoader:
     """
     Context manager để quản lý việc ghi dữ liệu vào tệp/dataset Parquet.
@@ -38,6 +62,7 @@ class ParquetLoader:
         self.dest_path = BASE_DATA_PATH / self.config.dest_table
         self.writer: Optional[pq.ParquetWriter] = None
         self.has_written_data = False
+        self.write_options = _parquet_write_options()
 
     def __enter__(self):
         # Đảm bảo thư mục đích tồn tại khi bắt đầu
@@ -67,6 +92,7 @@ class ParquetLoader:
                     root_path=str(self.dest_path),
                     partition_cols=self.config.partition_cols,
                     existing_data_behavior="overwrite_or_ignore",
+                    **self.write_options,
                 )
             else:
                 # Ghi vào một tệp Parquet duy nhất
@@ -75,7 +101,7 @@ class ParquetLoader:
                     if not self.config.incremental and output_file.exists():
                         output_file.unlink()
                     self.writer = pq.ParquetWriter(
-                        str(output_file), arrow_table.schema
+                        str(output_file), arrow_table.schema, **self.write_options
                     )
                 self.writer.write_table(arrow_table)
 
@@ -107,13 +133,14 @@ def refresh_duckdb_table(
     Tải dữ liệu từ Parquet vào DuckDB và thực hiện "atomic swap".
 
     Quy trình này đảm bảo an toàn và không gián đoạn cho người dùng cuối:
-    1. Tải dữ liệu từ Parquet vào một bảng tạm (_staging).
+    1. Mở một cursor riêng (context transaction riêng) cho luồng hiện tại.
     2. Bắt đầu một TRANSACTION.
-    3. Đổi tên bảng chính hiện tại (nếu có) thành bảng cũ (_old).
-    4. "Thăng cấp" bảng tạm thành bảng chính.
-    5. COMMIT transaction. Bước này diễn ra gần như tức thời.
-    6. Dọn dẹp bảng cũ và chạy ANALYZE để tối ưu hóa hiệu năng.
-    7. Nếu có lỗi, ROLLBACK để quay về trạng thái ban đầu.
+    3. Tải dữ liệu từ Parquet vào một bảng tạm (_staging).
+    4. Đổi tên bảng chính hiện tại (nếu có) thành bảng cũ (_old), "thăng cấp"
+       bảng tạm thành bảng chính và xóa bảng cũ.
+    5. COMMIT transaction: toàn bộ thay đổi được ghi trong một lần commit.
+    6. Chạy ANALYZE để tối ưu hóa hiệu năng.
+    7. Nếu có lỗi, ROLLBACK để quay về trạng thái ban đầu (kể cả bảng tạm).
     """
     if not has_new_data:
         logger.info(
@@ -127,52 +154,64 @@ def refresh_duckdb_table(
     staging_dir = str(BASE_DATA_PATH / dest_table)
 
     try:
-        # 1. Tải Parquet vào bảng staging
-        logger.info(f"Bắt đầu nạp Parquet vào staging table '{staging_table}'...")
-        conn.execute(
-            f"""
-            CREATE OR REPLACE TABLE {staging_table} AS
-            SELECT * FROM read_parquet('{staging_dir}/**', hive_partitioning=true);
-        """
-        )
-
-        # 2. Thực hiện hoán đổi nguyên tử (atomic swap) trong một transaction
-        logger.info(f"Bắt đầu hoán đổi (atomic swap) cho bảng '{dest_table}'...")
-        conn.execute(
-            f"""
-            BEGIN TRANSACTION;
-
-            -- Dọn dẹp bảng backup cũ nếu nó còn tồn tại từ lần chạy lỗi trước.
-            DROP TABLE IF EXISTS {backup_table};
-
-            -- Đổi tên bảng chính hiện tại thành bảng backup.
-            ALTER TABLE IF EXISTS {dest_table} RENAME TO {backup_table};
-
-            -- "Thăng cấp" bảng staging mới thành bảng chính.
-            ALTER TABLE {staging_table} RENAME TO {dest_table};
+        # `conn` được chia sẻ giữa các worker ETL. Mỗi cursor là một kết nối
+        # riêng tới cùng database, nên transaction của các bảng chạy song song
+        # không bị lẫn vào nhau.
+        with conn.cursor() as cur:
+            cur.execute("BEGIN TRANSACTION;")
+            try:
+                # 1. Tải Parquet vào bảng staging
+                logger.info(
+                    f"Bắt đầu nạp Parquet vào staging table '{staging_table}'..."
+                )
+                # Sắp xếp theo timestamp để zone map (min/max) của từng row group
+                # bám theo thời gian: truy vấn theo ngày/tháng của dashboard sẽ bỏ
+                # qua được các row group ngoài khoảng cần đọc.
+                ts_col = config.final_timestamp_col
+                order_by = f" ORDER BY {ts_col}" if ts_col else ""
+                cur.execute(
+                    f"""
+                    CREATE OR REPLACE TABLE {staging_table} AS
+                    SELECT * FROM read_parquet('{staging_dir}/**', hive_partitioning=true){order_by};
+                """
+                )
 
-            COMMIT;
-        """
-        )
-        logger.info(f"Hoán đổi bảng '{dest_table}' thành công.")
+                # 2. Hoán đổi nguyên tử (atomic swap) trong cùng transaction
+                logger.info(f"Bắt đầu hoán đổi (atomic swap) cho bảng '{dest_table}'...")
+                cur.execute(
+                    f"""
+                    -- Dọn dẹp bảng backup cũ nếu nó còn tồn tại từ lần chạy lỗi trước.
+                    DROP TABLE IF EXISTS {backup_table};
 
-        # 3. Dọn dẹp và tối ưu hóa
-        conn.execute(f"DROP TABLE IF EXISTS {backup_table};")
-        logger.debug(f"Đã dọn dẹp bảng backup '{backup_table}'.")
+                    -- Đổi tên bảng chính hiện tại thành bảng backup.
+                    ALTER TABLE IF EXISTS {dest_table} RENAME TO {backup_table};
 
-        if not config.incremental and settings.ETL_CLEANUP_ON_FAILURE:
-            shutil.rmtree(staging_dir)
-            logger.info(f"Đã dọn dẹp staging area '{staging_dir}'.")
+                    -- "Thăng cấp" bảng staging mới thành bảng chính.
+                    ALTER TABLE {staging_table} RENAME TO {dest_table};
 
-        # Cập nhật thống kê để bộ tối ưu hóa truy vấn của DuckDB hoạt động hiệu quả.
-        logger.info(f"Đang cập nhật thống kê cho bảng '{dest_table}'...")
-        conn.execute(f"ANALYZE {dest_table};")
-        logger.info(f"✅ Cập nhật thống kê cho bảng '{dest_table}' thành công.")
+                    -- Bảng backup không còn cần thiết sau khi hoán đổi.
+                    DROP TABLE IF EXISTS {backup_table};
+                """
+                )
+                cur.execute("COMMIT;")
+            except Exception:
+                cur.execute("ROLLBACK;")
+                logger.warning(f"Đã ROLLBACK transaction cho bảng '{dest_table}'.")
+                raise
+            logger.info(f"Hoán đổi bảng '{dest_table}' thành công.")
+
+            # 3. Dọn dẹp và tối ưu hóa
+            if not config.incremental and settings.ETL_CLEANUP_ON_FAILURE:
+                shutil.rmtree(staging_dir)
+                logger.info(f"Đã dọn dẹp staging area '{staging_dir}'.")
+
+            # Cập nhật thống kê để bộ tối ưu hóa truy vấn của DuckDB hoạt động hiệu quả.
+            logger.info(f"Đang cập nhật thống kê cho bảng '{dest_table}'...")
+            cur.execute(f"ANALYZE {dest_table};")
+            logger.info(f"✅ Cập nhật thống kê cho bảng '{dest_table}' thành công.")
 
     except Exception as e:
         logger.error(
             f"Lỗi khi refresh bảng DuckDB '{dest_table}': {e}", exc_info=True
         )
-        conn.execute("ROLLBACK;")
-        logger.warning(f"Đã ROLLBACK transaction cho bảng '{dest_table}'.")
         raise
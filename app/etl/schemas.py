@@ -8,7 +8,7 @@ giúp duy trì chất lượng và tính toàn vẹn của dữ liệu.
 """
 
 import pandera.pandas as pa
-from pandera.typing import DateTime, Int, Series, String
+from pandera.typing import DateTime, Int, Int8, Int16, Series, String
 
 
 class DimStoresSchema(pa.DataFrameModel):
@@ -33,8 +33,8 @@ class FactTrafficSchema(pa.DataFrameModel):
     store_id: Series[Int] = pa.Field(nullable=False)
 
     # Các cột partition được thêm vào trong quá trình transform.
-    year: Series[Int]
-    month: Series[Int]
+    year: Series[Int16]
+    month: Series[Int8]
 
     class Config:
         strict = True
@@ -52,8 +52,8 @@ class FactErrorsSchema(pa.DataFrameModel):
     error_message: Series[String] = pa.Field(nullable=True)
 
     # Các cột partition được thêm vào trong quá trình transform.
-    year: Series[Int]
-    month: Series[Int]
+    year: Series[Int16]
+    month: Series[Int8]
 
     class Config:
         strict = True
@@ -30,14 +30,16 @@ def load_etl_state() -> Dict[str, str]:
     Returns:
         Một dictionary chứa trạng thái của các bảng.
     """
-    if not STATE_FILE.exists():
-        logger.warning(f"Không tìm thấy tệp trạng thái '{STATE_FILE}'. "
-                       f"Giả định đây là lần chạy đầu tiên (full-load).")
-        return {}
+    # Mở trực tiếp và bắt `FileNotFoundError`, thay vì gọi `exists()` trước
+    # (thêm một lần `stat` và có thể sai lệch nếu tệp bị xóa giữa hai bước).
     try:
         with STATE_FILE.open("r", encoding="utf-8") as f:
             return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
+    except FileNotFoundError:
+        logger.warning(f"Không tìm thấy tệp trạng thái '{STATE_FILE}'. "
+                       f"Giả định đây là lần chạy đầu tiên (full-load).")
+        return {}
+    except json.JSONDecodeError:
         logger.warning(f"Không thể đọc tệp trạng thái '{STATE_FILE}'. "
                        f"Bắt đầu lại từ đầu.")
         return {}
@@ -54,7 +56,7 @@ def save_etl_state(state: Dict[str, str]):
         STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
         with STATE_FILE.open("w", encoding="utf-8") as f:
             json.dump(state, f, indent=4, ensure_ascii=False)
-        logger.debug(f"Trạng thái ETL đã được lưu vào: {STATE_FILE}")
+        logger.debug("Trạng thái ETL đã được lưu vào: %s", STATE_FILE)
     except IOError as e:
         logger.error(f"Lỗi nghiêm trọng khi ghi tệp trạng thái '{STATE_FILE}': {e}")
 
@@ -90,7 +92,9 @@ def update_timestamp(
         # Ví dụ: '2023-10-27 15:30:00'
         timestamp_str = new_timestamp.isoformat(sep=" ", timespec="seconds")
         state[table_name] = timestamp_str
-        logger.debug(f"Cập nhật high-water-mark cho '{table_name}': {timestamp_str}")
+        logger.debug(
+            "Cập nhật high-water-mark cho '%s': %s", table_name, timestamp_str
+        )
     else:
         logger.warning(
             f"Bỏ qua cập nhật high-water-mark cho '{table_name}' vì giá trị mới không hợp lệ."
@@ -12,6 +12,7 @@ Nhận vào một DataFrame thô và áp dụng một chuỗi các thao tác bi
 import logging
 import pandas as pd
 import pandera.errors as pa_errors
+import pyarrow as pa
 from typing import Optional
 
 from .schemas import table_schemas
@@ -19,6 +20,9 @@ from ..core.config import settings, TableConfig
 
 logger = logging.getLogger(__name__)
 
+# Cột mã cửa hàng (tên gốc ở nguồn) dùng để tra chênh lệch thời gian.
+OFFSET_STORE_ID_COL = "storeid"
+
 
 # --- Các hàm biến đổi riêng lẻ (Private Helper Functions) ---
 
@@ -34,7 +38,7 @@ def _apply_time_offsets(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
         return df
 
     # Các cột cần thiết cho việc điều chỉnh
-    store_id_col = "storeid"
+    store_id_col = OFFSET_STORE_ID_COL
     ts_col = config.timestamp_col
     if store_id_col not in df.columns or ts_col not in df.columns:
         logger.warning(
@@ -48,22 +52,43 @@ def _apply_time_offsets(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
         offsets, unit="m"
     )
 
-    logger.debug(f"Đã áp dụng điều chỉnh chênh lệch thời gian cho '{table_name_key}'.")
+    logger.debug(
+        "Đã áp dụng điều chỉnh chênh lệch thời gian cho '%s'.", table_name_key
+    )
     return df
 
 
+def _arrow_strip(col: pd.Series) -> pd.Series:
+    """
+    Strip chuỗi qua kiểu Arrow để chạy bằng kernel C++ của Arrow, thay vì lặp
+    qua từng đối tượng `str` của Python.
+    """
+    return col.astype(pd.ArrowDtype(pa.string())).str.strip()
+
+
 def _rename_and_clean(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
     """Đổi tên cột theo `rename_map` và áp dụng các quy tắc làm sạch."""
     if config.rename_map:
-        df = df.rename(columns=config.rename_map)
+        # Đổi tên tại chỗ: chỉ thay nhãn cột, không sao chép dữ liệu của chunk.
+        df.rename(columns=config.rename_map, inplace=True)
 
     for rule in config.cleaning_rules:
         # Lấy tên cột sau khi đã đổi tên để áp dụng rule
         col_to_clean = config.rename_map.get(rule.column, rule.column)
 
         if rule.action == "strip" and col_to_clean in df.columns:
-            if pd.api.types.is_object_dtype(df[col_to_clean]):
-                df[col_to_clean] = df[col_to_clean].str.strip()
+            col = df[col_to_clean]
+            if isinstance(col.dtype, (pd.StringDtype, pd.ArrowDtype)):
+                df[col_to_clean] = _arrow_strip(col)
+            # Không dùng `is_string_dtype`: nó trả về False cho cột object có
+            # chứa None/NaN, khiến các cột nullable bị bỏ qua không được strip.
+            elif pd.api.types.is_object_dtype(col):
+                try:
+                    df[col_to_clean] = _arrow_strip(col)
+                except (pa.ArrowTypeError, pa.ArrowInvalid):
+                    # Cột có giá trị không phải chuỗi: giữ cách cũ, `.str.strip()`
+                    # biến các giá trị đó thành NaN thay vì làm hỏng cả chunk.
+                    df[col_to_clean] = col.str.strip()
     return df
 
 
@@ -76,21 +101,32 @@ def _handle_data_types(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
     ]
     for col in filter(None, numeric_cols):
         if col in df.columns:
-            # Chuyển đổi, điền giá trị rỗng bằng 0, đảm bảo không âm
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
-            df[col] = df[col].apply(lambda x: max(0, x))
+            # Chuyển đổi, điền giá trị rỗng bằng 0, đảm bảo không âm.
+            # `clip` được vector hóa, thay cho việc gọi hàm Python trên từng dòng.
+            df[col] = (
+                pd.to_numeric(df[col], errors="coerce")
+                .fillna(0)
+                .clip(lower=0)
+                .astype(int)
+            )
 
     # Xử lý cột timestamp và tạo partition
     ts_col = config.final_timestamp_col
     if ts_col and ts_col in df.columns:
         df[ts_col] = pd.to_datetime(df[ts_col], errors="coerce")
-        df = df.dropna(subset=[ts_col])  # Loại bỏ các dòng có timestamp không hợp lệ
+        # Loại bỏ các dòng có timestamp không hợp lệ. Chỉ tạo DataFrame mới khi
+        # thực sự có dòng lỗi, tránh một bản sao toàn bộ chunk trong đa số trường hợp.
+        invalid_ts = df[ts_col].isna()
+        if invalid_ts.any():
+            df = df.loc[~invalid_ts].copy()
 
         if not df.empty:
+            # Timestamp đã sạch NaT nên có thể tạo thẳng kiểu số nhỏ gọn, khớp
+            # với schema và không cần ép kiểu lại khi validate.
             if "year" in config.partition_cols:
-                df["year"] = df[ts_col].dt.year
+                df["year"] = df[ts_col].dt.year.astype("int16")
             if "month" in config.partition_cols:
-                df["month"] = df[ts_col].dt.month
+                df["month"] = df[ts_col].dt.month.astype("int8")
     return df
 
 
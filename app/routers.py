@@ -70,7 +70,7 @@ async def get_dashboard_data(
     latest_time = DashboardService.get_latest_record_time()
 
     # Xây dựng đối tượng response hoàn chỉnh theo schema đã định nghĩa.
-    return schemas.DashboardData(
+    dashboard_data = schemas.DashboardData(
         metrics=schemas.Metric(**metrics_data),
         trend_chart=schemas.ChartData(series=trend_data),
         store_comparison_chart=schemas.ChartData(series=store_comparison_data),
@@ -78,6 +78,12 @@ async def get_dashboard_data(
         error_logs=error_logs,
         latest_record_time=latest_time,
     )
+    # Model đã được xác thực khi khởi tạo, nên mã hóa thẳng sang JSON một lần
+    # bằng pydantic-core. Trả về model sẽ khiến FastAPI dump ra dict, xác thực
+    # lại theo `response_model` rồi mới mã hóa JSON.
+    return Response(
+        content=dashboard_data.model_dump_json(), media_type="application/json"
+    )
 
 
 @router.get("/stores", response_model=List[str])
@@ -16,12 +16,37 @@ from typing import Any, Dict, List, Optional, Tuple
 import pandas as pd
 from dateutil.relativedelta import relativedelta
 
-from .core.caching import async_cache
+from .core.caching import async_cache, sync_cache
 from .core.config import settings
 from .dependencies import query_db_to_df
 
 logger = logging.getLogger(__name__)
 
+# Các bảng tra cứu theo kỳ báo cáo, được khởi tạo một lần khi import module
+# thay vì dựng lại trong mỗi lần gọi service.
+# Đơn vị thời gian dùng để nhóm dữ liệu cho từng kỳ.
+TIME_UNIT_BY_PERIOD = {"year": "month", "month": "day", "week": "day", "day": "hour"}
+# Định dạng hiển thị thời điểm cao điểm cho từng kỳ.
+PEAK_TIME_FORMAT_BY_PERIOD = {
+    "day": "%H:%M",
+    "week": "%d/%m",
+    "month": "%d/%m",
+    "year": "Tháng %m",
+}
+# Định dạng nhãn thời gian cho từng đơn vị thời gian.
+DATE_FORMAT_BY_TIME_UNIT = {
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+    "month": "%Y-%m",
+}
+# Độ dài của kỳ liền trước, dùng để tính tăng trưởng.
+PREVIOUS_PERIOD_DELTA = {
+    "day": {"days": 1},
+    "week": {"weeks": 1},
+    "month": {"months": 1},
+    "year": {"years": 1},
+}
+
 
 class DashboardService:
     """
@@ -93,43 +118,41 @@ class DashboardService:
         """
         filter_clauses, params = self._get_base_filters()
 
-        time_unit_map = {
-            "year": "month",
-            "month": "day",
-            "week": "day",
-            "day": "hour",
-        }
-        peak_time_format_map = {
-            "day": "%H:%M",
-            "week": "%d/%m",
-            "month": "%d/%m",
-            "year": "Tháng %m",
-        }
-        time_unit = time_unit_map.get(self.period, "day")
-        peak_time_format = peak_time_format_map.get(self.period, "%d/%m")
+        time_unit = TIME_UNIT_BY_PERIOD.get(self.period, "day")
+        peak_time_format = PEAK_TIME_FORMAT_BY_PERIOD.get(self.period, "%d/%m")
 
         # Truy vấn chính để lấy hầu hết các metrics trong một lần.
+        # Dữ liệu chỉ được quét một lần: GROUPING SETS tổng hợp đồng thời theo
+        # kỳ và theo cửa hàng, kết quả nhỏ này được MATERIALIZED để các truy
+        # vấn con bên dưới không phải quét lại VIEW.
         query = f"""
-        WITH filtered_data AS (
-            SELECT * FROM v_traffic_normalized
+        WITH grouped AS MATERIALIZED (
+            SELECT
+                date_trunc('{time_unit}', adjusted_time) as period,
+                store_name,
+                -- 1: dòng tổng hợp theo kỳ, 0: dòng tổng hợp theo cửa hàng.
+                GROUPING(store_name) as is_period_row,
+                SUM(in_count) as total_in,
+                SUM(out_count) as total_out
+            FROM v_traffic_normalized
             {filter_clauses}
+            GROUP BY GROUPING SETS ((period), (store_name))
         ),
         period_summary AS (
-            SELECT
-                date_trunc('{time_unit}', adjusted_time) as period,
-                SUM(in_count) as total_in_per_period
-            FROM filtered_data
-            GROUP BY period
+            SELECT period, total_in, total_out FROM grouped WHERE is_period_row = 1
+        ),
+        store_summary AS (
+            SELECT store_name, total_in FROM grouped WHERE is_period_row = 0
         )
         SELECT
-            (SELECT SUM(in_count) FROM filtered_data) as total_in,
-            (SELECT AVG(total_in_per_period) FROM period_summary) as average_in,
+            (SELECT SUM(total_in) FROM period_summary) as total_in,
+            (SELECT AVG(total_in) FROM period_summary) as average_in,
             (
                 SELECT strftime(period + INTERVAL '{settings.WORKING_HOUR_START} hours', '{peak_time_format}')
-                FROM period_summary ORDER BY total_in_per_period DESC LIMIT 1
+                FROM period_summary ORDER BY total_in DESC LIMIT 1
             ) as peak_time,
-            (SELECT SUM(in_count) - SUM(out_count) FROM filtered_data) as current_occupancy,
-            (SELECT store_name FROM filtered_data GROUP BY store_name ORDER BY SUM(in_count) DESC LIMIT 1) as busiest_store
+            (SELECT SUM(total_in) - SUM(total_out) FROM period_summary) as current_occupancy,
+            (SELECT store_name FROM store_summary ORDER BY total_in DESC LIMIT 1) as busiest_store
         """
         df_task = asyncio.to_thread(query_db_to_df, query, params=params)
         prev_total_task = self._get_previous_period_total_in()
@@ -166,11 +189,7 @@ class DashboardService:
         """
         Tính tổng lượt khách của kỳ liền trước để so sánh tăng trưởng.
         """
-        period_map = {
-            "day": {"days": 1}, "week": {"weeks": 1},
-            "month": {"months": 1}, "year": {"years": 1},
-        }
-        delta = period_map.get(self.period)
+        delta = PREVIOUS_PERIOD_DELTA.get(self.period)
         if not delta:
             return 0
 
@@ -192,6 +211,7 @@ class DashboardService:
         return 0 if df.empty or pd.isna(df["total"].iloc[0]) else int(df["total"].iloc[0])
 
     @staticmethod
+    @sync_cache
     def get_all_stores() -> List[str]:
         """Lấy danh sách duy nhất tất cả các cửa hàng (static method)."""
         df = query_db_to_df("SELECT DISTINCT store_name FROM dim_stores ORDER BY store_name")
@@ -201,25 +221,25 @@ class DashboardService:
     async def get_trend_chart_data(self) -> List[Dict[str, Any]]:
         """Lấy dữ liệu chuỗi thời gian cho biểu đồ xu hướng."""
         filter_clauses, params = self._get_base_filters()
-        time_unit = {"year": "month", "month": "day", "week": "day", "day": "hour"}.get(self.period, "day")
+        time_unit = TIME_UNIT_BY_PERIOD.get(self.period, "day")
+        date_format = DATE_FORMAT_BY_TIME_UNIT.get(time_unit, "%Y-%m-%d")
 
+        # Nhãn trục X được định dạng ngay trong DuckDB trên tập đã tổng hợp,
+        # thay vì `strftime` từng dòng bằng Pandas sau khi truy vấn.
         query = f"""
-        SELECT
-            (date_trunc('{time_unit}', adjusted_time) + INTERVAL '{settings.WORKING_HOUR_START} hours') as x,
-            SUM(in_count) as y
-        FROM v_traffic_normalized
-        {filter_clauses}
-        GROUP BY x ORDER BY x
+        WITH aggregated AS (
+            SELECT
+                (date_trunc('{time_unit}', adjusted_time) + INTERVAL '{settings.WORKING_HOUR_START} hours') as bucket,
+                SUM(in_count) as y
+            FROM v_traffic_normalized
+            {filter_clauses}
+            GROUP BY bucket
+        )
+        SELECT strftime(bucket, '{date_format}') as x, y
+        FROM aggregated
+        ORDER BY bucket
         """
         df = await asyncio.to_thread(query_db_to_df, query, params=params)
-        
-        # Định dạng lại trục X cho dễ đọc trên biểu đồ
-        if time_unit == "month":
-            df["x"] = pd.to_datetime(df["x"]).dt.strftime("%Y-%m")
-        elif time_unit == "day":
-            df["x"] = pd.to_datetime(df["x"]).dt.strftime("%Y-%m-%d")
-        else:  # hour
-            df["x"] = pd.to_datetime(df["x"]).dt.strftime("%Y-%m-%d %H:00")
 
         return df.to_dict(orient="records")
 
@@ -240,8 +260,8 @@ class DashboardService:
     async def get_table_details(self) -> Dict[str, Any]:
         """Lấy dữ liệu chi tiết cho bảng, giới hạn 31 dòng gần nhất."""
         filter_clauses, params = self._get_base_filters()
-        time_unit = {"year": "month", "month": "day", "week": "day", "day": "hour"}.get(self.period, "day")
-        date_format = {"hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d", "month": "%Y-%m"}.get(time_unit, "%Y-%m-%d")
+        time_unit = TIME_UNIT_BY_PERIOD.get(self.period, "day")
+        date_format = DATE_FORMAT_BY_TIME_UNIT.get(time_unit, "%Y-%m-%d")
 
         query = f"""
         WITH filtered_data AS (
@@ -283,6 +303,7 @@ class DashboardService:
         return {"data": df.to_dict(orient="records"), "summary": summary}
 
     @staticmethod
+    @sync_cache
     def get_latest_record_time() -> Optional[datetime]:
         """Lấy thời gian của bản ghi gần nhất trong toàn bộ dữ liệu."""
         df = query_db_to_df("SELECT MAX(recorded_at) as latest_time FROM fact_traffic")
@@ -291,6 +312,8 @@ class DashboardService:
         return df["latest_time"].iloc[0]
 
     @staticmethod
+    # TTL ngắn: log lỗi mới cần hiển thị sớm, không đợi hết TTL 30 phút chung.
+    @sync_cache(ttl=60)
     def get_error_logs(limit: int = 100) -> List[Dict[str, Any]]:
         """Lấy các log lỗi gần nhất từ bảng `fact_errors`."""
         query = """
@@ -6,9 +6,19 @@ các handlers (ví dụ: console, file), formatters và log levels. Hỗ trợ g
 log level thông qua biến môi trường, giúp việc gỡ lỗi trở nên dễ dàng hơn.
 """
 
+import atexit
+import copy
+import gzip
+import hashlib
+import json
 import logging
 import logging.config
+import logging.handlers
 import os
+import pprint
+import queue
+import shutil
+import tempfile
 from pathlib import Path
 from typing import Union
 
@@ -43,6 +53,199 @@ class MaxLevelFilter(logging.Filter):
         return record.levelno <= self.level
 
 
+class GzipTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """
+    `TimedRotatingFileHandler` nén các tệp log đã xoay vòng bằng gzip.
+
+    Log văn bản lặp lại rất nhiều (cùng định dạng, cùng tên logger), nên các
+    tệp cũ nén lại chỉ còn một phần nhỏ dung lượng. Tệp đang ghi vẫn là văn
+    bản thường; việc nén chỉ diễn ra một lần lúc xoay vòng (nửa đêm).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namer = self._gzip_namer
+        self.rotator = self._gzip_rotator
+
+    @staticmethod
+    def _gzip_namer(default_name: str) -> str:
+        return f"{default_name}.gz"
+
+    @staticmethod
+    def _gzip_rotator(source: str, dest: str) -> None:
+        with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+    def getFilesToDelete(self) -> list:
+        """
+        Chỉ chọn đúng các bản lưu `<tên file>.<ngày>[.gz]` của handler này.
+
+        Khi có `namer` tùy chỉnh, bản gốc của thư viện chuẩn so khớp rất lỏng
+        (theo tiền tố trước phần mở rộng), nên handler của `app.log` có thể
+        xóa nhầm các bản lưu `app.json.log.*.gz` nằm cùng thư mục. Đuôi `.gz`
+        là tùy chọn để các bản lưu chưa nén từ trước vẫn được dọn theo
+        `backupCount`.
+        """
+        dir_name, base_name = os.path.split(self.baseFilename)
+        prefix = f"{base_name}."
+        result = sorted(
+            os.path.join(dir_name, name)
+            for name in os.listdir(dir_name)
+            if name.startswith(prefix)
+            and self.extMatch.fullmatch(name[len(prefix) :].removesuffix(".gz"))
+        )
+        if len(result) <= self.backupCount:
+            return []
+        return result[: len(result) - self.backupCount]
+
+
+def _file_sha256(path: Path) -> str:
+    """Trả về mã băm SHA-256 (dạng hex) của nội dung tệp."""
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _load_config_dict(config_path: Path) -> dict:
+    """
+    Đọc cấu hình logging, ưu tiên bản sao JSON đã được tạo sẵn.
+
+    Thứ tự ưu tiên: module Python `_logger_cfg` được tạo lúc build, rồi đến
+    bản sao JSON, cuối cùng mới là tệp YAML gốc.
+
+    Parse JSON nhanh hơn nhiều so với YAML, nên sau lần đọc YAML đầu tiên,
+    nội dung sẽ được ghi ra tệp `.json` cùng tên. Các lần khởi động sau chỉ
+    cần đọc tệp JSON này, miễn là nó không cũ hơn tệp YAML gốc.
+
+    Args:
+        config_path: Đường dẫn đến tệp YAML cấu hình logging.
+
+    Returns:
+        Dictionary cấu hình (có thể rỗng nếu tệp YAML rỗng).
+    """
+    # Nhanh nhất: module Python được tạo sẵn lúc build (xem `build_config_module`).
+    # Chỉ dùng khi module được tạo từ đúng tệp này và nội dung YAML không đổi.
+    # So theo mã băm nội dung thay vì mtime: mtime có thể bị giữ nguyên hoặc
+    # lùi lại khi sao chép/giải nén tệp, khiến module cũ vẫn được dùng.
+    try:
+        from ._logger_cfg import CFG, SOURCE, SOURCE_SHA256
+
+        if (
+            Path(SOURCE) == config_path
+            and _file_sha256(config_path) == SOURCE_SHA256
+        ):
+            # `dictConfig` có thể sửa trực tiếp dict đầu vào, nên dùng bản sao.
+            return copy.deepcopy(CFG)
+    except (ImportError, OSError):
+        pass
+
+    json_path = config_path.with_suffix(".json")
+    try:
+        if json_path.stat().st_mtime >= config_path.stat().st_mtime:
+            with open(json_path, encoding="utf-8") as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        # Không có bản JSON hoặc bản JSON bị hỏng: quay về đọc YAML.
+        pass
+
+    with open(config_path, "r", encoding="utf-8") as f:
+        config_dict = yaml.safe_load(f)
+
+    if config_dict:
+        tmp_path = None
+        try:
+            # Ghi ra tệp tạm cùng thư mục rồi `os.replace` (nguyên tử), để tiến
+            # trình khác khởi động cùng lúc không bao giờ đọc phải tệp ghi dở.
+            with tempfile.NamedTemporaryFile(
+                "w",
+                encoding="utf-8",
+                dir=json_path.parent,
+                prefix=f".{json_path.name}.",
+                suffix=".tmp",
+                delete=False,
+            ) as f:
+                tmp_path = f.name
+                # Tệp chỉ dành cho máy đọc: ghi dạng gọn, không khoảng trắng thừa.
+                json.dump(config_dict, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, json_path)
+            tmp_path = None
+        except (OSError, TypeError) as e:
+            # Không ghi được bản sao (ví dụ: thư mục chỉ đọc) thì vẫn chạy tiếp.
+            # Dùng logger của module: gọi `logging.debug` ở cấp module lúc này
+            # sẽ ngầm chạy `basicConfig()` trước khi logging được cấu hình.
+            logging.getLogger(__name__).debug(
+                "Không thể ghi bản sao JSON '%s': %s", json_path, e
+            )
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    return config_dict
+
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    """
+    `QueueHandler` cho hàng đợi nằm trong cùng tiến trình.
+
+    `QueueHandler.prepare` mặc định định dạng sẵn traceback vào `msg` và xóa
+    `exc_info` để record có thể pickle. Hàng đợi ở đây không cần pickle, nên
+    chỉ gộp `args` vào `msg` (tránh đối số bị thay đổi trước khi listener
+    ghi) và giữ nguyên `exc_info`/`stack_info` cho các formatter phía sau,
+    ví dụ formatter JSON vẫn xuất được trường `exc_info` riêng.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+# Listener đang chạy (nếu có), để có thể dừng nó khi thoát hoặc cấu hình lại.
+_queue_listener: Union[logging.handlers.QueueListener, None] = None
+
+
+def _route_root_through_queue() -> None:
+    """
+    Đưa các handler của root logger ra sau một `QueueHandler`.
+
+    Luồng gọi log chỉ đưa record vào hàng đợi trong bộ nhớ; một luồng
+    `QueueListener` duy nhất đảm nhận toàn bộ việc ghi ra console và file.
+    Nhờ vậy, I/O của logging không chặn request hay các worker ETL, và các
+    luồng không phải tranh nhau khóa của từng handler.
+    """
+    global _queue_listener
+
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    if not handlers:
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(_InProcessQueueHandler(log_queue))
+
+    # `respect_handler_level` giữ nguyên level riêng của từng handler
+    # (ví dụ: stderr chỉ nhận từ WARNING trở lên).
+    _queue_listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _queue_listener.start()
+
+
+@atexit.register
+def _stop_queue_listener() -> None:
+    """Xả hết hàng đợi log trước khi các handler bị đóng (khi thoát hoặc cấu hình lại)."""
+    global _queue_listener
+
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
 def setup_logging(
     config_path: Union[str, Path] = "configs/logger.yaml",
     default_level: int = logging.INFO,
@@ -61,8 +264,10 @@ def setup_logging(
     config_path = Path(config_path)
 
     # Đảm bảo thư mục 'logs' tồn tại để các file handler có thể ghi file.
+    # Kiểm tra bằng `stat` trước để tránh một lời gọi `mkdir` thừa mỗi lần chạy.
     log_dir = Path("logs")
-    log_dir.mkdir(parents=True, exist_ok=True)
+    if not log_dir.is_dir():
+        log_dir.mkdir(parents=True, exist_ok=True)
 
     if not config_path.is_file():
         logging.basicConfig(level=default_level)
@@ -73,8 +278,7 @@ def setup_logging(
         return
 
     try:
-        with open(config_path, "r", encoding="utf-8") as f:
-            config_dict = yaml.safe_load(f)
+        config_dict = _load_config_dict(config_path)
         if not config_dict:
             raise ValueError("Tệp YAML rỗng hoặc không hợp lệ.")
 
@@ -89,10 +293,58 @@ def setup_logging(
                 f"bởi biến môi trường LOG_LEVEL."
             )
 
+        _stop_queue_listener()
         logging.config.dictConfig(config_dict)
+        _route_root_through_queue()
 
     except Exception as e:
         # Nếu có bất kỳ lỗi nào, quay về cấu hình cơ bản để đảm bảo
         # ứng dụng vẫn có thể ghi log lỗi.
         logging.basicConfig(level=default_level)
         logging.exception(f"Lỗi khi cấu hình logging từ tệp YAML: {e}")
+
+
+def build_config_module(
+    config_path: Union[str, Path] = "configs/logger.yaml",
+    output_path: Union[str, Path, None] = None,
+) -> Path:
+    """
+    Chuyển tệp YAML cấu hình logging thành một module Python chứa dict literal.
+
+    Dùng ở bước build (ví dụ: trong Dockerfile) để `setup_logging` không cần
+    parse tệp cấu hình khi khởi động. Module lưu lại mã băm SHA-256 nội dung
+    tệp YAML; nếu tệp YAML bị sửa sau đó, module sẽ bị bỏ qua cho đến khi
+    được tạo lại.
+
+    Args:
+        config_path: Đường dẫn đến tệp YAML cấu hình logging.
+        output_path: Đường dẫn tệp Python sẽ được tạo. Mặc định là
+            `_logger_cfg.py` cạnh module này.
+
+    Returns:
+        Đường dẫn tệp Python đã được tạo.
+    """
+    config_path = Path(config_path)
+    if output_path is None:
+        output_path = Path(__file__).with_name("_logger_cfg.py")
+    output_path = Path(output_path)
+
+    source_sha256 = _file_sha256(config_path)
+    with open(config_path, encoding="utf-8") as f:
+        config_dict = yaml.safe_load(f)
+    if not config_dict:
+        raise ValueError(f"Tệp cấu hình '{config_path}' rỗng hoặc không hợp lệ.")
+
+    content = (
+        f"# Tệp được tạo tự động từ '{config_path}'.\n"
+        f"# Chạy lại `python -m app.utils.logger` khi cấu hình thay đổi.\n"
+        f"SOURCE = {str(config_path)!r}\n"
+        f"SOURCE_SHA256 = {source_sha256!r}\n\n"
+        f"CFG = {pprint.pformat(config_dict, sort_dicts=False)}\n"
+    )
+    output_path.write_text(content, encoding="utf-8")
+    return output_path
+
+
+if __name__ == "__main__":
+    print(f"Đã tạo: {build_config_module()}")
@@ -8,35 +8,35 @@ Sử dụng Typer để tạo các câu lệnh tiện ích, bao gồm:
 """
 
 import contextlib
+import functools
 import logging
+import os
+import queue
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
-from typing import Iterator
+from threading import Event, Thread
+from typing import TYPE_CHECKING, Iterator, Optional, TypeVar
 from typing_extensions import Annotated
 
-import duckdb
-import pandera.errors as pa_errors
-import requests
 import typer
-import uvicorn
-from duckdb import DuckDBPyConnection
-from duckdb import Error as DuckdbError
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
-from sqlalchemy.exc import SQLAlchemyError
 from tenacity import (
     before_sleep_log,
     retry,
     retry_if_exception,
     stop_after_attempt,
-    wait_fixed,
+    wait_exponential_jitter,
 )
 
 from app.core.config import settings, TableConfig
-from app.etl import extract, state, transform
-from app.etl.load import ParquetLoader, prepare_destination, refresh_duckdb_table
 from app.utils.logger import setup_logging
 
+# Các thư viện nặng (duckdb, pandas, sqlalchemy, uvicorn, requests...) chỉ được
+# import bên trong câu lệnh cần đến chúng, giúp CLI (kể cả `--help`) khởi động
+# nhanh. Ở đây chỉ import để phục vụ type hint.
+if TYPE_CHECKING:
+    import pandas as pd
+    from duckdb import DuckDBPyConnection
+    from sqlalchemy.engine import Engine
+
 # Cấu hình logging ngay từ đầu để áp dụng cho toàn bộ ứng dụng.
 setup_logging("configs/logger.yaml")
 logger = logging.getLogger(__name__)
@@ -46,12 +46,36 @@ cli_app = typer.Typer(
     help="CLI để quản lý và vận hành ứng dụng Analytics iCount People."
 )
 
+T = TypeVar("T")
+
+# Đánh dấu iterator nguồn đã được đọc hết trong hàng đợi prefetch.
+_PREFETCH_DONE = object()
+
+
+@functools.cache
+def _duckdb_path() -> str:
+    """Đường dẫn tuyệt đối tới tệp DuckDB (chỉ resolve một lần mỗi tiến trình)."""
+    return str(settings.DUCKDB_PATH.resolve())
+
+
+@functools.cache
+def _tables_by_order() -> tuple[TableConfig, ...]:
+    """Danh sách cấu hình bảng đã sắp xếp theo `processing_order`."""
+    return tuple(
+        sorted(settings.TABLE_CONFIG.values(), key=lambda cfg: cfg.processing_order)
+    )
+
 
 @contextlib.contextmanager
-def _get_database_connections() -> Iterator[tuple[Engine, DuckDBPyConnection]]:
+def _get_database_connections(
+    max_workers: int = 4,
+) -> Iterator[tuple["Engine", "DuckDBPyConnection"]]:
     """
     Context manager để quản lý vòng đời kết nối đến các database.
 
+    Args:
+        max_workers: Số worker ETL chạy song song, dùng để định cỡ connection pool.
+
     Yields:
         Một tuple chứa (SQLAlchemy Engine, DuckDB Connection).
 
@@ -59,20 +83,43 @@ def _get_database_connections() -> Iterator[tuple[Engine, DuckDBPyConnection]]:
         SQLAlchemyError: Nếu không thể kết nối tới MS SQL Server.
         DuckdbError: Nếu không thể kết nối tới DuckDB.
     """
+    import duckdb
+    from duckdb import Error as DuckdbError
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import SQLAlchemyError
+
     sql_engine, duckdb_conn = None, None
     try:
         logger.info("Đang thiết lập kết nối tới MS SQL Server...")
+        # Không dùng `pool_pre_ping` (tốn một round-trip mỗi lần lấy kết nối);
+        # thay vào đó kiểm tra một lần khi khởi động và tái tạo kết nối cũ
+        # bằng `pool_recycle`.
         sql_engine = create_engine(
-            settings.db.sqlalchemy_db_uri, pool_pre_ping=True
+            settings.db.sqlalchemy_db_uri,
+            pool_pre_ping=False,
+            pool_recycle=1800,
+            pool_size=max_workers,
+            max_overflow=2,
         )
         with sql_engine.connect() as conn:
             conn.execute(text("SELECT 1"))  # Ping để kiểm tra
         logger.info("✅ Kết nối MS SQL Server thành công.")
 
         logger.info("Đang thiết lập kết nối tới DuckDB...")
-        duckdb_path = str(settings.DUCKDB_PATH.resolve())
+        duckdb_path = _duckdb_path()
         duckdb_conn = duckdb.connect(database=duckdb_path, read_only=False)
-        logger.info(f"✅ Kết nối DuckDB ('{duckdb_path}') thành công.\n")
+        # Đặt rõ số luồng để trình đọc Parquet song song của DuckDB tận dụng hết
+        # CPU, tránh bị giới hạn bởi giá trị phát hiện sai trong container.
+        threads = settings.DUCKDB_THREADS or os.cpu_count() or 1
+        duckdb_conn.execute(f"PRAGMA threads={int(threads)}")
+        if settings.DUCKDB_MEMORY_LIMIT:
+            duckdb_conn.execute(
+                f"PRAGMA memory_limit='{settings.DUCKDB_MEMORY_LIMIT}'"
+            )
+        logger.info(
+            f"✅ Kết nối DuckDB ('{duckdb_path}') thành công "
+            f"({threads} luồng).\n"
+        )
 
         yield sql_engine, duckdb_conn
 
@@ -91,44 +138,123 @@ def _get_database_connections() -> Iterator[tuple[Engine, DuckDBPyConnection]]:
             logger.debug("Kết nối DuckDB đã được đóng.")
 
 
+def _prefetch(iterator: Iterator[T], maxsize: int = 2) -> Iterator[T]:
+    """
+    Đọc trước các phần tử của `iterator` trong một luồng nền.
+
+    Luồng nền (producer) liên tục lấy các chunk từ SQL Server và đẩy vào một
+    hàng đợi có giới hạn, trong khi luồng gọi (consumer) transform và ghi
+    Parquet. Nhờ vậy thời gian chờ mạng được chồng lấp với thời gian xử lý.
+    Lỗi phát sinh ở luồng nền sẽ được ném lại ở luồng gọi để cơ chế retry
+    vẫn hoạt động như cũ.
+
+    Args:
+        iterator: Iterator nguồn (ví dụ: kết quả của `extract.from_sql_server`).
+        maxsize: Số chunk tối đa được đọc trước, giới hạn bộ nhớ sử dụng.
+
+    Yields:
+        Các phần tử của `iterator` theo đúng thứ tự ban đầu.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop_event = Event()
+
+    def _put(item) -> bool:
+        # Dùng timeout để luồng nền có thể dừng khi consumer đã thoát sớm.
+        while not stop_event.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _producer():
+        try:
+            for item in iterator:
+                if not _put(item):
+                    return
+        except BaseException as e:
+            _put(e)
+            return
+        _put(_PREFETCH_DONE)
+
+    producer = Thread(target=_producer, name="etl-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _PREFETCH_DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop_event.set()
+        producer.join()
+
+
 def _is_retryable_exception(exception: BaseException) -> bool:
-    """Kiểm tra xem một exception có thuộc loại có thể thử lại hay không."""
+    """
+    Kiểm tra xem một exception có thuộc loại có thể thử lại hay không.
+
+    Chỉ các lỗi kết nối/I/O mang tính tạm thời mới được thử lại. Lỗi
+    validation (`pandera.errors.SchemaErrors`) được cố ý loại trừ vì chạy
+    lại với cùng dữ liệu nguồn sẽ luôn cho cùng kết quả.
+    """
+    from duckdb import Error as DuckdbError
+    from sqlalchemy.exc import SQLAlchemyError
+
     return isinstance(exception, (SQLAlchemyError, DuckdbError, IOError))
 
 
 @retry(
     stop=stop_after_attempt(3),
-    wait=wait_fixed(15),
+    # Backoff lũy thừa có jitter: lỗi thoáng qua được thử lại gần như ngay lập
+    # tức, và các worker không cùng lúc dội lại SQL Server.
+    wait=wait_exponential_jitter(initial=1, max=30, jitter=2),
     before_sleep=before_sleep_log(logger, logging.WARNING),
     retry=retry_if_exception(_is_retryable_exception),
 )
 def _process_table(
-    sql_engine: Engine,
-    duckdb_conn: DuckDBPyConnection,
+    sql_engine: "Engine",
+    duckdb_conn: "DuckDBPyConnection",
     config: TableConfig,
-    etl_state: dict,
-    state_lock: Lock,
-):
+    last_timestamp: str,
+) -> tuple[str, Optional["pd.Timestamp"]]:
     """
     Xử lý toàn bộ pipeline ETL cho một bảng duy nhất (Extract -> Transform -> Load).
 
     Hàm này được bọc bởi decorator @retry để tự động thử lại nếu gặp lỗi
-    liên quan đến kết nối hoặc I/O.
+    liên quan đến kết nối hoặc I/O. Hàm không tự cập nhật trạng thái ETL mà
+    trả kết quả về cho luồng chính, tránh tranh chấp khóa giữa các worker.
+
+    Returns:
+        Tuple (tên bảng đích, high-water mark mới hoặc None nếu không đổi).
     """
+    import pandera.errors as pa_errors
+
+    from app.etl import extract, transform
+    from app.etl.load import (
+        ParquetLoader,
+        prepare_destination,
+        refresh_duckdb_table,
+    )
+
     logger.info(
         f"Bắt đầu xử lý bảng: '{config.source_table}' -> '{config.dest_table}' "
         f"(Incremental: {config.incremental})"
     )
     prepare_destination(config)
 
-    last_timestamp = state.get_last_timestamp(etl_state, config.dest_table)
     data_iterator = extract.from_sql_server(sql_engine, config, last_timestamp)
 
     total_rows, max_ts_in_run = 0, None
 
     try:
         with ParquetLoader(config) as loader:
-            for chunk in data_iterator:
+            # Extract chạy ở luồng nền; transform và ghi Parquet vẫn tuần tự
+            # trên luồng hiện tại để các chunk được ghi theo đúng thứ tự.
+            for chunk in _prefetch(data_iterator):
                 transformed_chunk = transform.run_transformations(chunk, config)
                 if transformed_chunk.empty:
                     continue
@@ -150,17 +276,11 @@ def _process_table(
             )
             refresh_duckdb_table(duckdb_conn, config, loader.has_written_data)
             logger.info(f"Nạp dữ liệu vào DuckDB '{config.dest_table}' hoàn tất.")
-
-            if config.incremental and max_ts_in_run:
-                with state_lock:
-                    state.update_timestamp(
-                        etl_state, config.dest_table, max_ts_in_run
-                    )
-                    state.save_etl_state(etl_state)
         else:
             logger.info(f"Không có dữ liệu mới cho bảng '{config.dest_table}'.")
+            max_ts_in_run = None
 
-        return config.dest_table
+        return config.dest_table, max_ts_in_run if config.incremental else None
 
     except pa_errors.SchemaErrors as e:
         logger.error(
@@ -179,6 +299,8 @@ def _process_table(
 
 def _trigger_cache_clear(host: str, port: int):
     """Gửi yêu cầu POST đến API server để xóa cache."""
+    import requests
+
     if not settings.INTERNAL_API_TOKEN:
         logger.warning(
             "INTERNAL_API_TOKEN chưa được cấu hình, bỏ qua việc xóa cache."
@@ -215,21 +337,20 @@ def run_etl(
     api_port: int = typer.Option(8000, help="Port của API server đang chạy."),
 ):
     """Chạy quy trình ETL đa luồng để đồng bộ dữ liệu từ SQL Server sang DuckDB."""
+    from app.etl import state
+
     logger.info("=" * 60)
     logger.info(f"🚀 BẮT ĐẦU QUY TRÌNH ETL (Tối đa {max_workers} luồng)")
     logger.info("=" * 60)
 
     succeeded, failed = [], []
     etl_state = state.load_etl_state()
-    state_lock = Lock()
 
-    tables_to_process = sorted(
-        settings.TABLE_CONFIG.values(), key=lambda cfg: cfg.processing_order
-    )
+    tables_to_process = _tables_by_order()
     total_tables = len(tables_to_process)
 
     try:
-        with _get_database_connections() as (sql_engine, duckdb_conn):
+        with _get_database_connections(max_workers) as (sql_engine, duckdb_conn):
             with ThreadPoolExecutor(max_workers=max_workers) as executor:
                 future_to_table = {
                     executor.submit(
@@ -237,8 +358,7 @@ def run_etl(
                         sql_engine,
                         duckdb_conn,
                         config,
-                        etl_state,
-                        state_lock,
+                        state.get_last_timestamp(etl_state, config.dest_table),
                     ): config
                     for config in tables_to_process
                 }
@@ -246,8 +366,15 @@ def run_etl(
                 for future in as_completed(future_to_table):
                     config = future_to_table[future]
                     try:
-                        result = future.result()
-                        succeeded.append(result)
+                        dest_table, max_ts = future.result()
+                        succeeded.append(dest_table)
+                        # Chỉ luồng chính cập nhật state, nên không cần khóa.
+                        # Lưu ngay sau mỗi bảng: nếu tiến trình bị dừng giữa
+                        # chừng, high-water mark của các bảng đã refresh không
+                        # bị mất (tránh nạp lặp dữ liệu ở lần chạy sau).
+                        if max_ts is not None:
+                            state.update_timestamp(etl_state, dest_table, max_ts)
+                            state.save_etl_state(etl_state)
                         logger.info(f"✅ Xử lý thành công '{config.dest_table}'.\n")
                     except Exception:
                         failed.append(config.dest_table)
@@ -277,6 +404,8 @@ def run_etl(
 @cli_app.command()
 def init_db():
     """Khởi tạo hoặc cập nhật các VIEWs cần thiết trong DuckDB."""
+    import duckdb
+
     logger.info("Bắt đầu khởi tạo/cập nhật VIEW 'v_traffic_normalized'...")
 
     scale = settings.OUTLIER_SCALE_RATIO
@@ -307,8 +436,7 @@ def init_db():
     """
 
     try:
-        db_path = str(settings.DUCKDB_PATH.resolve())
-        with duckdb.connect(database=db_path, read_only=False) as conn:
+        with duckdb.connect(database=_duckdb_path(), read_only=False) as conn:
             conn.execute(create_view_sql)
         logger.info("✅ Đã tạo/cập nhật thành công VIEW 'v_traffic_normalized'.")
     except Exception as e:
@@ -327,6 +455,8 @@ def serve(
     ] = True,
 ):
     """Khởi chạy ứng dụng web FastAPI với Uvicorn."""
+    import uvicorn
+
     logger.info(f"🚀 Khởi chạy FastAPI server tại http://{host}:{port}")
     uvicorn.run(
         "app.main:api_app",